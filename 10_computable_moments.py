@@ -1,82 +1,235 @@
+import mmap
+import numpy as np
 import time
-from typing import List, Tuple, Set
+from collections import defaultdict
+from itertools import islice
+from numba import get_num_threads, njit, prange
+from typing import Iterator, List, Tuple
  
-def parse_input(file_path: str) -> Tuple[int, List[Tuple[str, Set[str]]]]:
+def parse_input(file_path: str) -> Tuple[int, List[Tuple[bytes, int]]]:
     """
-    Parses the input file and converts tags to sets for efficient operations.
+    Parses the input file and converts tags to int bitmasks for efficient operations.
+    The file is memory-mapped and tokenized as bytes, so no str objects are decoded.
     """
-    with open(file_path, "r") as file:
-        lines = file.readlines()
+    with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        # Stream lines straight off the mapping rather than splitting the whole file into a list
+        lines = iter(mapped.readline, b"")
+        num_paintings = int(next(lines))
+        paintings = []
+        tag_id = {}
+        intern_tag = tag_id.setdefault  # Interns each tag token to a small int id (its bit position)
+        for i, line in enumerate(islice(lines, num_paintings)):
+            parts = line.split(maxsplit=2)
+            painting_type = parts[0]
+            tags = 0
+            for tag in (parts[2].split() if len(parts) > 2 else []):
+                tags |= 1 << intern_tag(tag, len(tag_id))
+            paintings.append((painting_type, tags))
+        return num_paintings, paintings
  
-    num_paintings = int(lines[0].strip())
-    paintings = []
-    for i, line in enumerate(lines[1:]):
-        parts = line.strip().split(maxsplit=2)
-        painting_type = parts[0]
-        tags = set(parts[2].split()) if len(parts) > 2 else set()
-        paintings.append((painting_type, tags))
-    return num_paintings, paintings
- 
-def create_frameglasses(paintings: List[Tuple[str, Set[str]]]) -> List[Tuple[List[int], Set[str]]]:
+def create_frameglasses(paintings: List[Tuple[bytes, int]], block_size: int = 256) -> List[Tuple[List[int], int]]:
     """
     Creates frameglasses and precomputes their tags with efficient pairing.
+    Partners are scored block_size portraits at a time, stopping once no later block can beat the best union.
     """
     landscapes = []
     portraits = []
  
     for i, (ptype, tags) in enumerate(paintings):
-        if ptype == "L":
+        if ptype == b"L":
             landscapes.append(([i], tags))
-        elif ptype == "P":
+        elif ptype == b"P":
             portraits.append((i, tags))
  
     if not portraits:
         return landscapes
  
     # Efficient pairing of portraits
-    portraits.sort(key=lambda x: len(x[1]), reverse=True)  # Sort by number of tags
+    portraits.sort(key=lambda x: x[1].bit_count(), reverse=True)  # Sort by number of tags
+    portrait_matrix = masks_to_matrix([tags for _, tags in portraits])
+    portrait_counts = popcount_rows(portrait_matrix)
     paired_portraits = []
-    while len(portraits) > 1:
-        p1 = portraits.pop(0)
-        best_match_idx = max(range(len(portraits)), key=lambda j: len(p1[1] | portraits[j][1]))
-        p2 = portraits.pop(best_match_idx)
-        paired_portraits.append(([p1[0], p2[0]], p1[1] | p2[1]))
+    alive = np.ones(len(portraits), dtype=bool)  # Paired portraits are switched off instead of popped
+    for i, p1 in enumerate(portraits):
+        if not alive[i]:
+            continue
+        alive[i] = False
+ 
+        # The union with p1 is at most the sum of both tag counts, which only shrinks along the sorted order
+        best_match_idx = -1
+        best_union = -1
+        for start in range(i + 1, len(portraits), block_size):
+            if portrait_counts[i] + portrait_counts[start] <= best_union:
+                break
+            block = slice(start, start + block_size)
+            union_sizes = popcount_rows(portrait_matrix[block] | portrait_matrix[i])
+            union_sizes[~alive[block]] = -1
+            k = int(union_sizes.argmax())
+            if union_sizes[k] > best_union:
+                best_union = int(union_sizes[k])
+                best_match_idx = start + k
+ 
+        # Add any remaining portrait
+        if best_match_idx < 0:
+            paired_portraits.append(([p1[0]], p1[1]))
+            break
  
-    # Add any remaining portrait
-    if portraits:
-        paired_portraits.append(([portraits[0][0]], portraits[0][1]))
+        alive[best_match_idx] = False
+        p2 = portraits[best_match_idx]
+        paired_portraits.append(([p1[0], p2[0]], p1[1] | p2[1]))
  
     return landscapes + paired_portraits
  
-def calculate_local_satisfaction(tags1: Set[str], tags2: Set[str]) -> int:
+# SWAR popcount constants; LLVM folds the sequence below into a single popcnt instruction
+M1 = np.uint64(0x5555555555555555)
+M2 = np.uint64(0x3333333333333333)
+M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+H01 = np.uint64(0x0101010101010101)
+ 
+@njit(inline="always")
+def popcount64(x: np.uint64) -> int:
+    """
+    Counts the set bits of a uint64 word.
+    """
+    x = x - ((x >> np.uint64(1)) & M1)
+    x = (x & M2) + ((x >> np.uint64(2)) & M2)
+    x = (x + (x >> np.uint64(4))) & M4
+    return np.int64((x * H01) >> np.uint64(56))
+ 
+@njit(cache=True)
+def popcount_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    Counts the set bits of each row of a uint64 matrix.
+    """
+    counts = np.zeros(matrix.shape[0], dtype=np.int64)
+    for i in range(matrix.shape[0]):
+        for w in range(matrix.shape[1]):
+            counts[i] += popcount64(matrix[i, w])
+    return counts
+ 
+@njit(cache=True)
+def local_score(matrix: np.ndarray, row_counts: np.ndarray, a: int, b: int) -> int:
+    """
+    Calculates the local satisfaction between two rows of a bitmask matrix.
+    """
+    common = 0
+    for w in range(matrix.shape[1]):
+        common += popcount64(matrix[a, w] & matrix[b, w])
+    return min(common, row_counts[a] - common, row_counts[b] - common)
+ 
+@njit(parallel=True, cache=True)
+def sequence_score(matrix: np.ndarray, row_counts: np.ndarray) -> int:
+    """
+    Sums the local satisfaction of every pair of consecutive rows of a uint64 matrix.
+    row_counts holds each row's popcount.
+    """
+    total = 0
+    # Pairs are independent, so prange spreads them over the threads and reduces the sum
+    for i in prange(matrix.shape[0] - 1):
+        total += local_score(matrix, row_counts, i, i + 1)
+    return total
+ 
+@njit(parallel=True, cache=True)
+def pick_best(matrix: np.ndarray, row_counts: np.ndarray, candidates: np.ndarray, current: int, num_chunks: int) -> Tuple[int, int]:
+    """
+    Returns the candidate row with the highest local satisfaction against the current row and its score.
+    row_counts holds each row's popcount; candidates are split into num_chunks chunks scanned in parallel.
+    """
+    num_candidates = candidates.shape[0]
+    chunk_size = (num_candidates + num_chunks - 1) // num_chunks
+    chunk_scores = np.full(num_chunks, -1, dtype=np.int64)
+    chunk_rows = np.full(num_chunks, -1, dtype=np.int64)
+ 
+    # No candidate can score above half of the smaller popcount
+    ceiling = row_counts[current] // 2
+ 
+    # Each thread scans a contiguous chunk of candidates and keeps its own best one
+    for chunk in prange(num_chunks):
+        for k in range(chunk * chunk_size, min(num_candidates, (chunk + 1) * chunk_size)):
+            i = candidates[k]
+            if min(row_counts[current], row_counts[i]) // 2 <= chunk_scores[chunk]:
+                continue
+            score = local_score(matrix, row_counts, current, i)
+            if score > chunk_scores[chunk]:
+                chunk_scores[chunk] = score
+                chunk_rows[chunk] = i
+                if score >= ceiling:
+                    break
+ 
+    best_score = -1
+    best_row = -1
+    for chunk in range(num_chunks):
+        if chunk_scores[chunk] > best_score:
+            best_score = chunk_scores[chunk]
+            best_row = chunk_rows[chunk]
+    return best_row, best_score
+
+ 
+def masks_to_matrix(masks: List[int]) -> np.ndarray:
     """
-    Calculates the local satisfaction score for two frameglasses.
+    Packs int bitmasks into an (N, W) uint64 matrix with W = ceil(num_tags / 64).
     """
-    common = len(tags1 & tags2)
-    only_in_tags1 = len(tags1 - tags2)
-    only_in_tags2 = len(tags2 - tags1)
-    return min(common, only_in_tags1, only_in_tags2)
+    width = max(1, (max(masks, default=0).bit_length() + 63) // 64)
+    # Serialize all masks into one little-endian buffer so the matrix is a single contiguous block
+    packed = b"".join(mask.to_bytes(width * 8, "little") for mask in masks)
+    return np.frombuffer(packed, dtype="<u8").astype(np.uint64).reshape(len(masks), width)
  
-def optimize_sequence(frameglasses: List[Tuple[List[int], Set[str]]]) -> List[Tuple[List[int], Set[str]]]:
+def iter_tag_ids(mask: int) -> Iterator[int]:
     """
-    Optimizes the order of frameglasses using a greedy algorithm.
+    Yields the ids of the tags set in a bitmask, lowest first.
     """
-    sequence = [frameglasses.pop(0)]
-    while frameglasses:
-        current_tags = sequence[-1][1]
-        best_next = max(frameglasses, key=lambda fg: calculate_local_satisfaction(current_tags, fg[1]))
-        sequence.append(best_next)
-        frameglasses.remove(best_next)
+    while mask:
+        low_bit = mask & -mask
+        yield low_bit.bit_length() - 1
+        mask ^= low_bit
+ 
+def construct_graph(masks: List[int]) -> List[np.ndarray]:
+    """
+    Constructs a graph where each frameglass is a node, and edges connect frameglasses sharing a common tag.
+    """
+    tag_to_frames = defaultdict(list)
+    for idx, mask in enumerate(masks):
+        for tag in iter_tag_ids(mask):
+            tag_to_frames[tag].append(idx)
+ 
+    graph = [set() for _ in masks]
+    for frames in tag_to_frames.values():
+        for idx in frames:
+            graph[idx].update(frames)
+    for idx, neighbors in enumerate(graph):
+        neighbors.discard(idx)
+    return [np.array(sorted(neighbors), dtype=np.int64) for neighbors in graph]
+ 
+def optimize_sequence(frameglasses: List[Tuple[List[int], int]]) -> List[Tuple[List[int], int]]:
+    """
+    Optimizes the order of frameglasses using a greedy algorithm with a jitted scoring kernel.
+    Only neighbors in the shared-tag graph are scored, since any other frameglass scores zero.
+    """
+    masks = [tags for _, tags in frameglasses]
+    matrix = masks_to_matrix(masks)
+    row_counts = popcount_rows(matrix)
+    graph = construct_graph(masks)
+    alive = np.ones(len(frameglasses), dtype=bool)
+ 
+    last = 0
+    alive[last] = False
+    sequence = [frameglasses[last]]
+    for _ in range(len(frameglasses) - 1):
+        neighbors = graph[last]
+        candidates = neighbors[alive[neighbors]]
+        best, best_score = pick_best(matrix, row_counts, candidates, last, get_num_threads())
+        # When no neighbor scores above zero every remaining frameglass ties, so take the first one
+        last = best if best_score > 0 else int(alive.argmax())
+        alive[last] = False
+        sequence.append(frameglasses[last])
     return sequence
  
-def calculate_global_score(sequence: List[Tuple[List[int], Set[str]]]) -> int:
+def calculate_global_score(sequence: List[Tuple[List[int], int]]) -> int:
     """
     Calculates the global robotic satisfaction score for a sequence of frameglasses.
     """
-    return sum(
-        calculate_local_satisfaction(sequence[i][1], sequence[i + 1][1])
-        for i in range(len(sequence) - 1)
-    )
+    sequence_matrix = masks_to_matrix([mask for _, mask in sequence])
+    return int(sequence_score(sequence_matrix, popcount_rows(sequence_matrix)))
  
 def process_data(input_file: str, output_file: str) -> None:
     """
@@ -98,10 +251,11 @@ def process_data(input_file: str, output_file: str) -> None:
     print(f"Global Satisfaction Score: {score}")
  
     # Step 5: Write output
+    # Build the whole payload first so it goes out in a single write
+    lines = [str(len(optimized_sequence))]
+    lines.extend(" ".join(map(str, frame)) for frame, _ in optimized_sequence)
     with open(output_file, "w") as file:
-        file.write(f"{len(optimized_sequence)}\n")
-        for frame, _ in optimized_sequence:
-            file.write(" ".join(map(str, frame)) + "\n")
+        file.write("\n".join(lines) + "\n")
  
     end_time = time.time()
     print(f"Execution Time: {end_time - start_time:.6f} seconds")
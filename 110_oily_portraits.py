@@ -1,118 +1,217 @@
-import pandas as pd
+import mmap
+import numpy as np
 import time
-from typing import List, Dict, Set, Tuple
+from numba import get_num_threads, njit, prange
+from typing import List, Dict, Tuple
+from functools import reduce
+from itertools import islice
+from operator import or_
 
 
-def read_input(file_path: str) -> Tuple[int, pd.DataFrame]:
+def read_input(file_path: str) -> Tuple[int, np.ndarray, List[int]]:
     """
-    Reads and parses the input file into a pandas DataFrame.
+    Reads and parses the input file into painting types and tag bitmasks.
+    Each painting's tags are stored as an int bitmask over a global tag-to-bit map.
+    The file is memory-mapped and tokenized as bytes, so no str objects are decoded.
     """
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
+    with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        # Stream lines straight off the mapping rather than splitting the whole file into a list
+        lines = iter(mapped.readline, b"")
+        num_paintings = int(next(lines))
+        types = []
+        masks = []
+        tag_id = {}
+        for line in islice(lines, num_paintings):
+            painting_type, _, *tags = line.split()
+            types.append(painting_type)
+
+            # Assign every distinct tag a bit position on first sight
+            mask = 0
+            for tag in tags:
+                mask |= 1 << tag_id.setdefault(tag, len(tag_id))
+            masks.append(mask)
+        return num_paintings, np.array(types), masks
+
+
+def frame_tags(frame: List[int], tags_cache: List[int]) -> int:
+    """
+    Returns the union of the tag bitmasks of the paintings in a frame.
+    """
+    return reduce(or_, (tags_cache[idx] for idx in frame), 0)
+
+
+# SWAR popcount constants; LLVM folds the sequence below into a single popcnt instruction
+M1 = np.uint64(0x5555555555555555)
+M2 = np.uint64(0x3333333333333333)
+M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+H01 = np.uint64(0x0101010101010101)
+
+
+@njit(inline="always")
+def popcount64(x: np.uint64) -> int:
+    """
+    Counts the set bits of a uint64 word.
+    """
+    x = x - ((x >> np.uint64(1)) & M1)
+    x = (x & M2) + ((x >> np.uint64(2)) & M2)
+    x = (x + (x >> np.uint64(4))) & M4
+    return np.int64((x * H01) >> np.uint64(56))
+
+
+@njit(cache=True)
+def popcount_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    Counts the set bits of each row of a uint64 matrix.
+    """
+    counts = np.zeros(matrix.shape[0], dtype=np.int64)
+    for i in range(matrix.shape[0]):
+        for w in range(matrix.shape[1]):
+            counts[i] += popcount64(matrix[i, w])
+    return counts
+
+
+@njit(cache=True)
+def local_score(matrix: np.ndarray, row_counts: np.ndarray, a: int, b: int) -> int:
+    """
+    Calculates the local satisfaction between two rows of a bitmask matrix.
+    """
+    common = 0
+    for w in range(matrix.shape[1]):
+        common += popcount64(matrix[a, w] & matrix[b, w])
+    return min(common, row_counts[a] - common, row_counts[b] - common)
+
+
+@njit(parallel=True, cache=True)
+def sequence_score(matrix: np.ndarray, row_counts: np.ndarray) -> int:
+    """
+    Sums the local satisfaction of every pair of consecutive rows of a uint64 matrix.
+    row_counts holds each row's popcount.
+    """
+    total = 0
+    # Pairs are independent, so prange spreads them over the threads and reduces the sum
+    for i in prange(matrix.shape[0] - 1):
+        total += local_score(matrix, row_counts, i, i + 1)
+    return total
+
 
-    num_paintings = int(lines[0].strip())
-    data = [line.strip().split(maxsplit=2) for line in lines[1:]]
-    df = pd.DataFrame(data, columns=["Type", "Tag_Count", "Tags"])
-    df["Tag_Count"] = df["Tag_Count"].astype(int)
-    df["Tags"] = df["Tags"].apply(lambda x: set(x.split()))
-    return num_paintings, df
+@njit(parallel=True, cache=True)
+def pick_best(matrix: np.ndarray, row_counts: np.ndarray, alive: np.ndarray, current: int, num_chunks: int) -> int:
+    """
+    Returns the alive row with the highest local satisfaction against the current row, or -1.
+    row_counts holds each row's popcount; rows are split into num_chunks chunks scanned in parallel.
+    """
+    num_rows = matrix.shape[0]
+    chunk_size = (num_rows + num_chunks - 1) // num_chunks
+    chunk_scores = np.full(num_chunks, -1, dtype=np.int64)
+    chunk_rows = np.full(num_chunks, -1, dtype=np.int64)
+
+    # No candidate can score above half of the smaller popcount
+    ceiling = row_counts[current] // 2
+
+    # Each thread scans a contiguous chunk of rows and keeps its own best candidate
+    for chunk in prange(num_chunks):
+        for i in range(chunk * chunk_size, min(num_rows, (chunk + 1) * chunk_size)):
+            if not alive[i]:
+                continue
+            if min(row_counts[current], row_counts[i]) // 2 <= chunk_scores[chunk]:
+                continue
+            score = local_score(matrix, row_counts, current, i)
+            if score > chunk_scores[chunk]:
+                chunk_scores[chunk] = score
+                chunk_rows[chunk] = i
+                if score >= ceiling:
+                    break
+
+    best_score = -1
+    best_row = -1
+    for chunk in range(num_chunks):
+        if chunk_scores[chunk] > best_score:
+            best_score = chunk_scores[chunk]
+            best_row = chunk_rows[chunk]
+    return best_row
+
+
+def masks_to_matrix(masks: List[int]) -> np.ndarray:
+    """
+    Packs int bitmasks into an (N, W) uint64 matrix with W = ceil(num_tags / 64).
+    """
+    width = max(1, (max(masks, default=0).bit_length() + 63) // 64)
+    # Serialize all masks into one little-endian buffer so the matrix is a single contiguous block
+    packed = b"".join(mask.to_bytes(width * 8, "little") for mask in masks)
+    return np.frombuffer(packed, dtype="<u8").astype(np.uint64).reshape(len(masks), width)
 
 
-def calculate_score(frames: List[List[int]], tags_cache: Dict[int, Set[str]]) -> int:
+def calculate_score(sequence_matrix: np.ndarray) -> int:
     """
-    Calculates the global satisfaction score for a sequence of frames.
+    Calculates the global satisfaction score for a sequence of frames packed as rows of a uint64 matrix.
     """
-    score = 0
-    for i in range(len(frames) - 1):
-        tags1 = set.union(*[tags_cache[idx] for idx in frames[i]])
-        tags2 = set.union(*[tags_cache[idx] for idx in frames[i + 1]])
-        common = len(tags1 & tags2)
-        unique_tags1 = len(tags1 - tags2)
-        unique_tags2 = len(tags2 - tags1)
-        score += min(common, unique_tags1, unique_tags2)
-    return score
+    return int(sequence_score(sequence_matrix, popcount_rows(sequence_matrix)))
 
 
-def fast_pair_portraits(paintings: Dict[int, Set[str]]) -> List[List[int]]:
+def fast_pair_portraits(paintings: Dict[int, int]) -> List[List[int]]:
     """
     Quickly pairs portraits based on precomputed tag scores.
     """
     pairs = []
-    used = set()
     items = list(paintings.items())
-    items.sort(key=lambda x: len(x[1]), reverse=True)  # Sort by tag count descending
+    items.sort(key=lambda x: x[1].bit_count(), reverse=True)  # Sort by tag count descending
+    tag_counts = [tags.bit_count() for _, tags in items]  # Reused by every partner scan
+    alive = bytearray(b"\x01") * len(items)  # Paired items are switched off instead of popped
 
-    while items:
-        idx1, tags1 = items.pop(0)  # Take the painting with the most tags
-        if idx1 in used:
+    for i, (idx1, tags1) in enumerate(items):  # Take the painting with the most tags
+        if not alive[i]:
             continue
+        alive[i] = 0
 
         best_pair = None
         best_score = float('-inf')
         best_index = -1
+        tag_count1 = tag_counts[i]
 
-        # Limit comparisons to the top remaining items
-        for i, (idx2, tags2) in enumerate(items[:50]):  # Adjust candidate pool size
-            if idx2 in used:
+        # Scan remaining items until their tag counts can no longer beat the best diversity score
+        for j in range(i + 1, len(items)):
+            if not alive[j]:
                 continue
+            idx2, tags2 = items[j]
+            if tag_count1 + tag_counts[j] <= best_score:
+                break  # Items are sorted by tag count, so no later candidate can do better
 
             # Calculate diversity score
-            union_size = len(tags1 | tags2)
-            intersection_size = len(tags1 & tags2)
+            union_size = (tags1 | tags2).bit_count()
+            intersection_size = (tags1 & tags2).bit_count()
             score = union_size - intersection_size
 
             if score > best_score:
                 best_score = score
                 best_pair = idx2
-                best_index = i
+                best_index = j
 
         if best_pair is not None:
             pairs.append([idx1, best_pair])
-            used.add(idx1)
-            used.add(best_pair)
-            items.pop(best_index)  # Remove the paired item
+            alive[best_index] = 0  # Remove the paired item
         else:
             pairs.append([idx1])  # Single painting
 
     return pairs
 
 
-def greedy_arrangement(glassframes: List[List[int]], tags_cache: Dict[int, Set[str]]) -> List[List[int]]:
+def greedy_arrangement(frame_matrix: np.ndarray) -> List[int]:
     """
-    Greedily arranges glassframes to optimize satisfaction score.
+    Greedily arranges glassframes to optimize satisfaction score, returning their order.
     """
-    arranged_frames = [glassframes.pop(0)]  # Start with the first frame
+    row_counts = popcount_rows(frame_matrix)
+    alive = np.ones(len(frame_matrix), dtype=bool)
 
-    while glassframes:
-        current_frame = arranged_frames[-1]
-        current_tags = set.union(*[tags_cache[idx] for idx in current_frame])
-
-        best_pair = None
-        best_score = float('-inf')
-        best_index = -1
-
-        # Limit comparisons to the top candidates
-        for i, candidate_frame in enumerate(glassframes[:100]):  # Adjust candidate pool size
-            candidate_tags = set.union(*[tags_cache[idx] for idx in candidate_frame])
-            common = len(current_tags & candidate_tags)
-            unique_tags1 = len(current_tags - candidate_tags)
-            unique_tags2 = len(candidate_tags - current_tags)
-            score = min(common, unique_tags1, unique_tags2)  # Use satisfaction metric
-
-            if score > best_score:
-                best_score = score
-                best_pair = candidate_frame
-                best_index = i
-
-        # Append the best candidate to the arrangement
-        if best_pair is not None:
-            arranged_frames.append(best_pair)
-            glassframes.pop(best_index)
-        else:
-            # If no suitable pair is found, append the next frame
-            arranged_frames.append(glassframes.pop(0))
+    last = 0  # Start with the first frame
+    alive[last] = False
+    order = [last]
+    for _ in range(len(frame_matrix) - 1):
+        # The jitted kernel scans every remaining frame, so no candidate pool cap is needed
+        last = pick_best(frame_matrix, row_counts, alive, last, get_num_threads())
+        alive[last] = False
+        order.append(last)
 
-    return arranged_frames
+    return order
 
 
 def process_file_with_fast_optimization(file_path: str, output_path: str) -> None:
@@ -123,25 +222,28 @@ def process_file_with_fast_optimization(file_path: str, output_path: str) -> Non
     start_time = time.time()
 
     # Step 1: Read input
-    num_paintings, df = read_input(file_path)
+    num_paintings, types, tags_cache = read_input(file_path)
 
-    # Step 2: Precompute tags cache
-    tags_cache = {idx: row["Tags"] for idx, row in df.iterrows()}
+    # Step 2: Fast pair portraits
+    paired_frames = fast_pair_portraits(dict(enumerate(tags_cache)))
 
-    # Step 3: Fast pair portraits
-    paired_frames = fast_pair_portraits({idx: tags_cache[idx] for idx in df.index})
+    # Step 3: Precompute the tag union of each frame once
+    frame_masks = [frame_tags(frame, tags_cache) for frame in paired_frames]
+    frame_matrix = masks_to_matrix(frame_masks)
 
     # Step 4: Greedy arrangement
-    arranged_frames = greedy_arrangement(paired_frames, tags_cache)
+    order = greedy_arrangement(frame_matrix)
+    arranged_frames = [paired_frames[i] for i in order]
 
     # Step 5: Calculate final score
-    score = calculate_score(arranged_frames, tags_cache)
+    score = calculate_score(frame_matrix[order])
 
     # Step 6: Write output
+    # Build the whole payload first so it goes out in a single write
+    lines = [str(len(arranged_frames))]
+    lines.extend(" ".join(map(str, frame)) for frame in arranged_frames)
     with open(output_path, 'w') as file:
-        file.write(f"{len(arranged_frames)}\n")
-        for frame in arranged_frames:
-            file.write(" ".join(map(str, frame)) + "\n")
+        file.write("\n".join(lines) + "\n")
 
     end_time = time.time()
     execution_time = end_time - start_time
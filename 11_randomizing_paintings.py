@@ -1,147 +1,359 @@
-import pandas as pd
+# The Numba kernels below are compiled on the first run and cached in __pycache__ next to this
+# script, so a cold cache adds a few seconds of compile time once. Inputs with fewer than
+# JIT_MIN_FRAMES frames take the NumPy path instead and never compile a kernel.
+import mmap
+import numpy as np
 import time
-from typing import List, Dict, Set, Tuple
-from collections import Counter, defaultdict
-import heapq
+from numba import get_num_threads, njit, prange
+from typing import List, Dict, Iterator, Tuple
+from functools import reduce
+from itertools import chain, islice
+from operator import or_
 
 
-def read_input(file_path: str) -> Tuple[int, pd.DataFrame]:
+def read_input(file_path: str) -> Tuple[int, np.ndarray, List[int]]:
     """
-    Reads and parses the input file into a pandas DataFrame.
+    Reads and parses the input file into painting types and tag bitmasks.
+    Each painting's tags are stored as an int bitmask over a global tag-to-bit map.
+    The file is memory-mapped and tokenized as bytes, so no str objects are decoded.
     """
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
+    with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        # Stream lines straight off the mapping rather than splitting the whole file into a list
+        lines = iter(mapped.readline, b"")
+        num_paintings = int(next(lines))
+        types = []
+        masks = []
+        tag_id = {}
+        for line in islice(lines, num_paintings):
+            painting_type, _, *tags = line.split()
+            types.append(painting_type)
+
+            # Assign every distinct tag a bit position on first sight
+            mask = 0
+            for tag in tags:
+                mask |= 1 << tag_id.setdefault(tag, len(tag_id))
+            masks.append(mask)
+        return num_paintings, np.array(types), masks
+
+
+def iter_tag_ids(mask: int) -> Iterator[int]:
+    """
+    Yields the ids of the tags set in a bitmask, lowest first.
+    """
+    while mask:
+        low_bit = mask & -mask
+        yield low_bit.bit_length() - 1
+        mask ^= low_bit
+
+
+def frame_tags(frame: List[int], tags_cache: List[int]) -> int:
+    """
+    Returns the union of the tag bitmasks of the paintings in a frame.
+    """
+    return reduce(or_, (tags_cache[idx] for idx in frame), 0)
+
+
+# SWAR popcount constants; LLVM folds the sequence below into a single popcnt instruction
+M1 = np.uint64(0x5555555555555555)
+M2 = np.uint64(0x3333333333333333)
+M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+H01 = np.uint64(0x0101010101010101)
+
+
+@njit(inline="always")
+def popcount64(x: np.uint64) -> int:
+    """
+    Counts the set bits of a uint64 word.
+    """
+    x = x - ((x >> np.uint64(1)) & M1)
+    x = (x & M2) + ((x >> np.uint64(2)) & M2)
+    x = (x + (x >> np.uint64(4))) & M4
+    return np.int64((x * H01) >> np.uint64(56))
+
+
+@njit(cache=True)
+def popcount_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    Counts the set bits of each row of a uint64 matrix.
+    """
+    counts = np.zeros(matrix.shape[0], dtype=np.int64)
+    for i in range(matrix.shape[0]):
+        for w in range(matrix.shape[1]):
+            counts[i] += popcount64(matrix[i, w])
+    return counts
+
+
+@njit(cache=True)
+def local_score(matrix: np.ndarray, row_counts: np.ndarray, a: int, b: int) -> int:
+    """
+    Calculates the local satisfaction between two rows of a bitmask matrix.
+    """
+    common = 0
+    for w in range(matrix.shape[1]):
+        common += popcount64(matrix[a, w] & matrix[b, w])
+    return min(common, row_counts[a] - common, row_counts[b] - common)
+
+
+@njit(parallel=True, cache=True)
+def sequence_score(matrix: np.ndarray, row_counts: np.ndarray) -> int:
+    """
+    Sums the local satisfaction of every pair of consecutive rows of a uint64 matrix.
+    row_counts holds each row's popcount.
+    """
+    total = 0
+    # Pairs are independent, so prange spreads them over the threads and reduces the sum
+    for i in prange(matrix.shape[0] - 1):
+        total += local_score(matrix, row_counts, i, i + 1)
+    return total
+
+
+@njit(parallel=True, cache=True)
+def pick_best(matrix: np.ndarray, row_counts: np.ndarray, alive: np.ndarray, current: int, num_chunks: int) -> int:
+    """
+    Returns the alive row with the highest local satisfaction against the current row, or -1.
+    row_counts holds each row's popcount; rows are split into num_chunks chunks scanned in parallel.
+    """
+    num_rows = matrix.shape[0]
+    chunk_size = (num_rows + num_chunks - 1) // num_chunks
+    chunk_scores = np.full(num_chunks, -1, dtype=np.int64)
+    chunk_rows = np.full(num_chunks, -1, dtype=np.int64)
+
+    # No candidate can score above half of the smaller popcount
+    ceiling = row_counts[current] // 2
+
+    # Each thread scans a contiguous chunk of rows and keeps its own best candidate
+    for chunk in prange(num_chunks):
+        for i in range(chunk * chunk_size, min(num_rows, (chunk + 1) * chunk_size)):
+            if not alive[i]:
+                continue
+            if min(row_counts[current], row_counts[i]) // 2 <= chunk_scores[chunk]:
+                continue
+            score = local_score(matrix, row_counts, current, i)
+            if score > chunk_scores[chunk]:
+                chunk_scores[chunk] = score
+                chunk_rows[chunk] = i
+                if score >= ceiling:
+                    break
+
+    best_score = -1
+    best_row = -1
+    for chunk in range(num_chunks):
+        if chunk_scores[chunk] > best_score:
+            best_score = chunk_scores[chunk]
+            best_row = chunk_rows[chunk]
+    return best_row
+
+
+def masks_to_matrix(masks: List[int]) -> np.ndarray:
+    """
+    Packs int bitmasks into an (N, W) uint64 matrix with W = ceil(num_tags / 64).
+    """
+    width = max(1, (max(masks, default=0).bit_length() + 63) // 64)
+    # Serialize all masks into one little-endian buffer so the matrix is a single contiguous block
+    packed = b"".join(mask.to_bytes(width * 8, "little") for mask in masks)
+    return np.frombuffer(packed, dtype="<u8").astype(np.uint64).reshape(len(masks), width)
+
+
+# Below this many frames, compiling the kernels on a cold cache costs more than the whole run
+JIT_MIN_FRAMES = 500
+
+
+def count_bits(matrix: np.ndarray) -> np.ndarray:
+    """
+    Counts the set bits of each row of a uint64 matrix with NumPy alone, without compiling a kernel.
+    """
+    return np.unpackbits(np.ascontiguousarray(matrix).view(np.uint8), axis=1).sum(axis=1, dtype=np.int64)
+
 
-    num_paintings = int(lines[0].strip())
-    data = [line.strip().split(maxsplit=2) for line in lines[1:]]
-    df = pd.DataFrame(data, columns=["Type", "Tag_Count", "Tags"])
-    df["Tag_Count"] = df["Tag_Count"].astype(int)
-    df["Tags"] = df["Tags"].apply(lambda x: set(x.split()))
-    return num_paintings, df
+def pick_best_numpy(matrix: np.ndarray, row_counts: np.ndarray, alive: np.ndarray, current: int) -> int:
+    """
+    NumPy counterpart of pick_best for small inputs; ties likewise go to the lowest row.
+    """
+    common = count_bits(matrix & matrix[current])
+    scores = np.minimum(common, np.minimum(row_counts[current] - common, row_counts - common))
+    scores[~alive] = -1
+    best = int(scores.argmax())
+    return best if scores[best] >= 0 else -1
 
 
-def calculate_score(frames: List[List[int]], tags_cache: Dict[int, Set[str]]) -> int:
+def calculate_score(sequence_matrix: np.ndarray) -> int:
     """
-    Calculates the global satisfaction score for a sequence of frames.
+    Calculates the global satisfaction score for a sequence of frames packed as rows of a uint64 matrix.
     """
-    score = 0
-    for i in range(len(frames) - 1):
-        tags1 = set.union(*[tags_cache[idx] for idx in frames[i]])
-        tags2 = set.union(*[tags_cache[idx] for idx in frames[i + 1]])
-        common = len(tags1 & tags2)
-        unique_tags1 = len(tags1 - tags2)
-        unique_tags2 = len(tags2 - tags1)
-        score += min(common, unique_tags1, unique_tags2)
-    return score
+    if len(sequence_matrix) < JIT_MIN_FRAMES:
+        row_counts = count_bits(sequence_matrix)
+        common = count_bits(sequence_matrix[:-1] & sequence_matrix[1:])
+        return int(np.minimum(common, np.minimum(row_counts[:-1] - common, row_counts[1:] - common)).sum())
+    return int(sequence_score(sequence_matrix, popcount_rows(sequence_matrix)))
 
 
-def pair_portraits(paintings: Dict[int, Set[str]]) -> List[List[int]]:
+def pair_portraits(paintings: Dict[int, int]) -> List[List[int]]:
     """
     Pairs portraits for maximum diversity.
+    Portraits are taken in descending tag count order and matched to the remaining portrait
+    with the largest symmetric tag difference, which is bounded above by the sum of tag counts.
     """
     paired = []
-    used = set()
-    items = list(paintings.items())
+    items = sorted(paintings.items(), key=lambda x: x[1].bit_count(), reverse=True)
+    tag_counts = [tags.bit_count() for _, tags in items]  # Reused by every partner scan
+    alive = bytearray(b"\x01") * len(items)
 
     for i, (idx1, tags1) in enumerate(items):
-        if idx1 in used:
+        if not alive[i]:
             continue
+        alive[i] = 0
         best_pair = None
         best_score = -1
-        for j, (idx2, tags2) in enumerate(items):
-            if idx2 in used or idx1 == idx2:
+        best_index = -1
+        tag_count1 = tag_counts[i]
+        for j in range(i + 1, len(items)):
+            if not alive[j]:
                 continue
-            common = len(tags1 & tags2)
-            diversity = len(tags1 | tags2)
-            score = diversity - common
+            idx2, tags2 = items[j]
+            if tag_count1 + tag_counts[j] <= best_score:
+                break  # Items are sorted by tag count, so no later candidate can do better
+            score = (tags1 ^ tags2).bit_count()  # |tags1 | tags2| - |tags1 & tags2|
             if score > best_score:
                 best_score = score
                 best_pair = idx2
+                best_index = j
         if best_pair is not None:
             paired.append([idx1, best_pair])
-            used.add(idx1)
-            used.add(best_pair)
+            alive[best_index] = 0
         else:
             paired.append([idx1])
     return paired
 
 
-def arrange_landscapes_by_rare_tags(paintings: Dict[int, Set[str]]) -> List[List[int]]:
+def arrange_landscapes_by_rare_tags(paintings: Dict[int, int]) -> List[List[int]]:
     """
     Arranges landscapes by prioritizing rare tags.
     """
-    tag_frequencies = Counter(tag for tags in paintings.values() for tag in tags)
-    rare_tags = sorted(tag_frequencies.keys(), key=lambda tag: tag_frequencies[tag])
+    # Flatten every (painting, tag id) occurrence into parallel arrays
+    tag_lists = [list(iter_tag_ids(tags)) for tags in paintings.values()]
+    tag_ids = np.fromiter(chain.from_iterable(tag_lists), dtype=np.int64)
+    owners = np.repeat(np.fromiter(paintings, dtype=np.int64), [len(tags) for tags in tag_lists])
 
-    tag_to_paintings = defaultdict(list)
-    for idx, tags in paintings.items():
-        for tag in tags:
-            tag_to_paintings[tag].append(idx)
+    tag_frequencies = np.bincount(tag_ids)
+    rare_tags = np.argsort(tag_frequencies, kind="stable")
+    tag_rank = np.empty_like(rare_tags)
+    tag_rank[rare_tags] = np.arange(len(rare_tags))
 
-    arranged_paintings = []
-    used_paintings = set()
-
-    for tag in rare_tags:
-        if tag not in tag_to_paintings:
-            continue
-        for painting_idx in tag_to_paintings[tag]:
-            if painting_idx not in used_paintings:
-                arranged_paintings.append([painting_idx])
-                used_paintings.add(painting_idx)
+    # Visit occurrences rarest tag first, keeping painting order within a tag, and keep each painting's first visit
+    visit_order = owners[np.argsort(tag_rank[tag_ids], kind="stable")]
+    _, first_visits = np.unique(visit_order, return_index=True)
+    arranged_paintings = [[painting_idx] for painting_idx in visit_order[np.sort(first_visits)].tolist()]
 
     return arranged_paintings
 
 
-def batch_processing(frames: List[List[int]], tags_cache: Dict[int, Set[str]], batch_size: int = 100) -> List[List[int]]:
+@njit(cache=True)
+def touching_edges_score(order: np.ndarray, matrix: np.ndarray, row_counts: np.ndarray, i: int, j: int) -> int:
+    """
+    Sums the local satisfaction of the transitions touching positions i < j of a frame order.
+    """
+    total = 0
+    for k in (i - 1, i, j - 1, j):
+        if k < 0 or k >= order.shape[0] - 1 or (k == j - 1 and k == i):
+            continue
+        total += local_score(matrix, row_counts, order[k], order[k + 1])
+    return total
+
+
+@njit(cache=True)
+def refine_sequence(order: np.ndarray, matrix: np.ndarray, row_counts: np.ndarray, window: int, sweeps: int) -> None:
+    """
+    Improves a frame order in place by swapping each frame with a later one within the window
+    whenever the swap raises the score, for up to the given number of sweeps.
+    """
+    n = order.shape[0]
+    for _ in range(sweeps):
+        improved = False
+        for i in range(n - 1):
+            for j in range(i + 1, min(n, i + window)):
+                before = touching_edges_score(order, matrix, row_counts, i, j)
+                order[i], order[j] = order[j], order[i]
+                if touching_edges_score(order, matrix, row_counts, i, j) > before:
+                    improved = True
+                else:
+                    order[i], order[j] = order[j], order[i]
+        if not improved:
+            break
+
+
+@njit(cache=True)
+def two_opt_sequence(order: np.ndarray, matrix: np.ndarray, row_counts: np.ndarray, window: int, sweeps: int) -> None:
+    """
+    Improves a frame order in place by reversing the segment order[i..j] within the window
+    whenever the two transitions it rewires score higher, for up to the given number of sweeps.
+    """
+    n = order.shape[0]
+    for _ in range(sweeps):
+        improved = False
+        for i in range(1, n - 1):
+            for j in range(i + 1, min(n, i + window)):
+                # Local satisfaction is symmetric, so only the edges at both ends of the segment change
+                before = local_score(matrix, row_counts, order[i - 1], order[i])
+                after = local_score(matrix, row_counts, order[i - 1], order[j])
+                if j + 1 < n:
+                    before += local_score(matrix, row_counts, order[j], order[j + 1])
+                    after += local_score(matrix, row_counts, order[i], order[j + 1])
+                if after > before:
+                    lo, hi = i, j
+                    while lo < hi:
+                        order[lo], order[hi] = order[hi], order[lo]
+                        lo += 1
+                        hi -= 1
+                    improved = True
+        if not improved:
+            break
+
+
+def batch_processing(frame_ids: List[int], frames: List[List[int]], frame_matrix: np.ndarray, batch_size: int = 100,
+                     window: int = 50, sweeps: int = 3, reversal_window: int = 500) -> List[int]:
     """
     Processes frames in batches to reduce computation time.
+    Batches are ordered greedily, then joined and refined with bounded local swaps and segment reversals.
+    Inputs below JIT_MIN_FRAMES keep the greedy order, since the refinement passes only exist as kernels.
     """
-    batches = [frames[i:i + batch_size] for i in range(0, len(frames), batch_size)]
-    ordered_batches = []
+    batches = [frame_ids[i:i + batch_size] for i in range(0, len(frame_ids), batch_size)]
+    use_jit = len(frame_ids) >= JIT_MIN_FRAMES
 
+    final_sequence = []
     for batch in batches:
-        ordered_batches.append(fast_greedy(batch, tags_cache))
+        final_sequence.extend(fast_greedy(batch, frames, frame_matrix, use_jit))
 
-    final_sequence = []
-    while ordered_batches:
-        current_batch = ordered_batches.pop(0)
-        if not final_sequence:
-            final_sequence.extend(current_batch)
-        else:
-            final_sequence.extend(fast_greedy(current_batch, tags_cache))
-    return final_sequence
+    if not use_jit:
+        return final_sequence
 
+    order = np.array(final_sequence, dtype=np.int64)
+    row_counts = popcount_rows(frame_matrix)
+    refine_sequence(order, frame_matrix, row_counts, window, sweeps)
+    two_opt_sequence(order, frame_matrix, row_counts, reversal_window, sweeps)
+    return order.tolist()
 
-def fast_greedy(frames: List[List[int]], tags_cache: Dict[int, Set[str]]) -> List[List[int]]:
+
+def fast_greedy(frame_ids: List[int], frames: List[List[int]], frame_matrix: np.ndarray, use_jit: bool = True) -> List[int]:
     """
-    Faster greedy ordering of frames using a priority queue.
+    Faster greedy ordering of frames using a jitted bitmask scoring kernel.
+    Ties go to the lexicographically smallest frame, as with a heap of (score, frame) entries.
     """
-    ordered = [frames.pop(0)]
-    heap = []
-
-    current_tags = set.union(*[tags_cache[idx] for idx in ordered[-1]])
-    for frame in frames:
-        candidate_tags = set.union(*[tags_cache[idx] for idx in frame])
-        common = len(current_tags & candidate_tags)
-        unique_current = len(current_tags - candidate_tags)
-        unique_candidate = len(candidate_tags - current_tags)
-        score = -min(common, unique_current, unique_candidate)
-        heapq.heappush(heap, (score, frame))
-
-    while heap:
-        _, best_frame = heapq.heappop(heap)
-        ordered.append(best_frame)
-        frames.remove(best_frame)
-
-        current_tags = set.union(*[tags_cache[idx] for idx in ordered[-1]])
-        heap = []
-        for frame in frames:
-            candidate_tags = set.union(*[tags_cache[idx] for idx in frame])
-            common = len(current_tags & candidate_tags)
-            unique_current = len(current_tags - candidate_tags)
-            unique_candidate = len(candidate_tags - current_tags)
-            score = -min(common, unique_current, unique_candidate)
-            heapq.heappush(heap, (score, frame))
+    # pick_best breaks ties towards the lowest row, so lay the candidates out in frame order
+    frame_ids = frame_ids[:1] + sorted(frame_ids[1:], key=frames.__getitem__)
+    matrix = frame_matrix[frame_ids]
+    row_counts = popcount_rows(matrix) if use_jit else count_bits(matrix)
+    alive = np.ones(len(frame_ids), dtype=bool)
+
+    last = 0
+    alive[last] = False
+    ordered = [frame_ids[last]]
+    for _ in range(len(frame_ids) - 1):
+        if use_jit:
+            last = pick_best(matrix, row_counts, alive, last, get_num_threads())
+        else:
+            last = pick_best_numpy(matrix, row_counts, alive, last)
+        alive[last] = False
+        ordered.append(frame_ids[last])
 
     return ordered
 
@@ -153,31 +365,34 @@ def process_file_with_optimizations(file_path: str, output_path: str) -> None:
     start_time = time.time()
 
     # Step 1: Read input
-    num_paintings, df = read_input(file_path)
-
-    # Step 2: Precompute tags cache
-    tags_cache = {idx: row["Tags"] for idx, row in df.iterrows()}
+    num_paintings, types, tags_cache = read_input(file_path)
 
-    # Step 3: Separate portraits and landscapes
-    portraits = df[df["Type"] == "P"].index.tolist()
-    landscapes = df[df["Type"] == "L"].index.tolist()
+    # Step 2: Separate portraits and landscapes
+    portraits = np.flatnonzero(types == b"P").tolist()
+    landscapes = np.flatnonzero(types == b"L").tolist()
 
-    # Step 4: Process portraits and landscapes
+    # Step 3: Process portraits and landscapes
     portrait_frames = pair_portraits({idx: tags_cache[idx] for idx in portraits})
     landscape_frames = arrange_landscapes_by_rare_tags({idx: tags_cache[idx] for idx in landscapes})
 
-    # Step 5: Combine frames and apply batch processing
+    # Step 4: Combine frames and precompute the tag union of each frame once
     all_frames = portrait_frames + landscape_frames
-    ordered_frames = batch_processing(all_frames, tags_cache, batch_size=100)
+    frame_masks = [frame_tags(frame, tags_cache) for frame in all_frames]
+    frame_matrix = masks_to_matrix(frame_masks)
+
+    # Step 5: Apply batch processing over frame indices
+    order = batch_processing(list(range(len(all_frames))), all_frames, frame_matrix, batch_size=100)
+    ordered_frames = [all_frames[i] for i in order]
 
     # Step 6: Calculate final score
-    score = calculate_score(ordered_frames, tags_cache)
+    score = calculate_score(frame_matrix[order])
 
     # Step 7: Write output
+    # Build the whole payload first so it goes out in a single write
+    lines = [str(len(ordered_frames))]
+    lines.extend(" ".join(map(str, frame)) for frame in ordered_frames)
     with open(output_path, 'w') as file:
-        file.write(f"{len(ordered_frames)}\n")
-        for frame in ordered_frames:
-            file.write(" ".join(map(str, frame)) + "\n")
+        file.write("\n".join(lines) + "\n")
 
     end_time = time.time()
     execution_time = end_time - start_time
@@ -1,65 +1,87 @@
-import pandas as pd
+import mmap
+import numpy as np
 import time
-from typing import List, Dict, Set, Tuple
+from itertools import islice
+from numba import njit
+from typing import Tuple
 
 
-def read_input(file_path: str) -> Tuple[int, pd.DataFrame, Dict[str, List[int]]]:
+def read_input(file_path: str) -> Tuple[int, np.ndarray, np.ndarray]:
     """
-    Reads and parses the input file into a pandas DataFrame and creates a tag-to-painting map.
+    Reads and parses the input file into CSR-style tag arrays: painting p's tags are
+    tag_ids[tag_offsets[p]:tag_offsets[p + 1]].
+    Tags are interned to int ids; the vocabulary is far too large for per-painting bitmasks.
+    The file is memory-mapped and tokenized as bytes, so no str objects are decoded.
     """
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
-
-    num_paintings = int(lines[0].strip())
-    data = [line.strip().split(maxsplit=2) for line in lines[1:]]
-    df = pd.DataFrame(data, columns=["Type", "Tag_Count", "Tags"])
-    df["Tag_Count"] = df["Tag_Count"].astype(int)
-    df["Tags"] = df["Tags"].apply(lambda x: set(x.split()))
-
-    # Create a tag-to-painting map
-    tag_to_paintings = {}
-    for idx, row in df.iterrows():
-        for tag in row["Tags"]:
-            if tag not in tag_to_paintings:
-                tag_to_paintings[tag] = []
-            tag_to_paintings[tag].append(idx)
-
-    return num_paintings, df, tag_to_paintings
-
-
-def construct_graph(tag_to_paintings: Dict[str, List[int]]) -> Dict[int, Set[int]]:
+    with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        # Stream lines straight off the mapping rather than splitting the whole file into a list
+        lines = iter(mapped.readline, b"")
+        num_paintings = int(next(lines))
+        tag_counts = []
+        tag_ids = []
+        tag_id = {}
+        intern_tag = tag_id.setdefault
+        for line in islice(lines, num_paintings):
+            # A tag repeated on one line still counts once for its painting
+            ids = list(dict.fromkeys(intern_tag(tag, len(tag_id)) for tag in line.split()[2:]))
+            tag_counts.append(len(ids))
+            tag_ids.extend(ids)
+
+    tag_offsets = np.zeros(num_paintings + 1, dtype=np.int64)
+    np.cumsum(tag_counts, out=tag_offsets[1:])
+    return num_paintings, tag_offsets, np.array(tag_ids, dtype=np.int64)
+
+
+def construct_graph(tag_offsets: np.ndarray, tag_ids: np.ndarray, num_paintings: int) -> Tuple[np.ndarray, np.ndarray]:
     """
-    Constructs a graph where each painting is a node, and edges connect paintings sharing a common tag.
+    Constructs a CSR graph where each painting is a node, and edges connect paintings sharing a common tag.
+    The neighbors of painting p are indices[indptr[p]:indptr[p + 1]].
     """
-    graph = {}
-    for tag, paintings in tag_to_paintings.items():
-        if len(paintings) == 2:
-            p1, p2 = paintings
-            if p1 not in graph:
-                graph[p1] = set()
-            if p2 not in graph:
-                graph[p2] = set()
-            graph[p1].add(p2)
-            graph[p2].add(p1)
-    return graph
-
-
-def traverse_graph(graph: Dict[int, Set[int]], start: int, visited: Set[int]) -> List[int]:
+    # Group tag occurrences by tag id; the stable sort keeps each tag's paintings in input order,
+    # so every tag held by exactly two paintings contributes one consecutive pair
+    owners = np.repeat(np.arange(num_paintings, dtype=np.int64), np.diff(tag_offsets))
+    by_tag = np.argsort(tag_ids, kind="stable")
+    shared_by_two = np.bincount(tag_ids)[tag_ids[by_tag]] == 2
+    edges = owners[by_tag][shared_by_two].reshape(-1, 2)
+    sources = np.concatenate((edges[:, 0], edges[:, 1]))
+    targets = np.concatenate((edges[:, 1], edges[:, 0]))
+
+    # Degree counts give the row offsets; a stable sort by source lays the neighbor lists out contiguously
+    indptr = np.zeros(num_paintings + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=num_paintings), out=indptr[1:])
+    indices = targets[np.argsort(sources, kind="stable")]
+    return indptr, indices
+
+
+@njit(cache=True)
+def traverse_graph(indptr: np.ndarray, indices: np.ndarray) -> np.ndarray:
     """
-    Traverses the graph starting from a given node to form a sequence of paintings.
+    Traverses the graph depth-first from each unvisited painting in turn to form a sequence of paintings.
     """
-    sequence = []
-    stack = [start]
-
-    while stack:
-        current = stack.pop()
-        if current in visited:
+    num_paintings = indptr.shape[0] - 1
+    visited = np.zeros(num_paintings, dtype=np.bool_)
+    stack = np.empty(indices.shape[0] + 1, dtype=np.int64)
+    sequence = np.empty(num_paintings, dtype=np.int64)
+    length = 0
+
+    for start in range(num_paintings):
+        if visited[start]:
             continue
-        visited.add(current)
-        sequence.append([current])
-        for neighbor in graph[current]:
-            if neighbor not in visited:
-                stack.append(neighbor)
+        stack[0] = start
+        top = 1
+        while top:
+            top -= 1
+            current = stack[top]
+            if visited[current]:
+                continue
+            visited[current] = True
+            sequence[length] = current
+            length += 1
+            for k in range(indptr[current], indptr[current + 1]):
+                neighbor = indices[k]
+                if not visited[neighbor]:
+                    stack[top] = neighbor
+                    top += 1
 
     return sequence
 
@@ -70,29 +92,24 @@ def process_landscapes_with_graph(file_path: str, output_path: str) -> None:
     """
     start_time = time.time()
 
-    # Step 1: Read input and create tag-to-painting map
-    num_paintings, df, tag_to_paintings = read_input(file_path)
+    # Step 1: Read input into CSR tag arrays
+    num_paintings, tag_offsets, tag_ids = read_input(file_path)
 
     # Step 2: Construct the graph
-    graph = construct_graph(tag_to_paintings)
-
-    # Step 3: Traverse the graph to form sequences
-    visited = set()
-    sequences = []
+    indptr, indices = construct_graph(tag_offsets, tag_ids, num_paintings)
 
-    for painting in range(num_paintings):
-        if painting not in visited:
-            sequences.extend(traverse_graph(graph, painting, visited))
+    # Step 3: Traverse the graph to form a sequence of single-landscape frames
+    sequence = traverse_graph(indptr, indices)
 
     # Step 4: Calculate score
-    tags_cache = {idx: row["Tags"] for idx, row in df.iterrows()}
-    score = calculate_score(sequences, tags_cache)
+    score = calculate_score(sequence, tag_offsets, tag_ids)
 
     # Step 5: Write output
+    # Build the whole payload first so it goes out in a single write
+    lines = [str(len(sequence))]
+    lines.extend(map(str, sequence.tolist()))
     with open(output_path, 'w') as file:
-        file.write(f"{len(sequences)}\n")
-        for frame in sequences:
-            file.write(" ".join(map(str, frame)) + "\n")
+        file.write("\n".join(lines) + "\n")
 
     end_time = time.time()
     execution_time = end_time - start_time
@@ -103,18 +120,28 @@ def process_landscapes_with_graph(file_path: str, output_path: str) -> None:
 
 
 # Utility Function to Calculate Score
-def calculate_score(frames: List[List[int]], tags_cache: Dict[int, Set[str]]) -> int:
+@njit(cache=True)
+def calculate_score(sequence: np.ndarray, tag_offsets: np.ndarray, tag_ids: np.ndarray) -> int:
     """
-    Calculates the global satisfaction score for a sequence of frames.
+    Calculates the global satisfaction score for a sequence of single-landscape frames.
     """
+    # last_seen[t] is the position of the latest frame holding tag t, so common tags with the
+    # previous frame are counted in one pass over each frame's tags
+    num_tags = tag_ids.max() + 1 if tag_ids.shape[0] else 0
+    last_seen = np.full(num_tags, -1, dtype=np.int64)
     score = 0
-    for i in range(len(frames) - 1):
-        tags1 = set.union(*[tags_cache[idx] for idx in frames[i]])
-        tags2 = set.union(*[tags_cache[idx] for idx in frames[i + 1]])
-        common = len(tags1 & tags2)
-        unique_tags1 = len(tags1 - tags2)
-        unique_tags2 = len(tags2 - tags1)
-        score += min(common, unique_tags1, unique_tags2)
+    for k in range(sequence.shape[0]):
+        painting = sequence[k]
+        common = 0
+        for j in range(tag_offsets[painting], tag_offsets[painting + 1]):
+            if k > 0 and last_seen[tag_ids[j]] == k - 1:
+                common += 1
+            last_seen[tag_ids[j]] = k
+        if k > 0:
+            previous = sequence[k - 1]
+            unique_tags1 = tag_offsets[previous + 1] - tag_offsets[previous] - common
+            unique_tags2 = tag_offsets[painting + 1] - tag_offsets[painting] - common
+            score += min(common, unique_tags1, unique_tags2)
     return score
 
 